@@ -7,86 +7,94 @@ from util.keyboard import monitor_keyboards_thread
 # Stores the assigned evdev.InputDevice for each player.
 player_keyboards = {}  # {player_id: evdev.InputDevice}
 # Tracks which player is currently registering their keyboard (1 or 2).
-current_player_registering = 1
-# Flag to control the keyboard monitoring thread's lifecycle.
-is_running = True
+# Held in a list so that updates made by the monitoring thread are visible here.
+current_player_registering = [1]
+# Set to stop the keyboard monitoring thread.
+stop_event = threading.Event()
 # A lock to protect access to shared state variables (player_keyboards, current_player_registering)
 # when accessed from both the main Tkinter thread and the monitoring thread.
-ui_update_lock = threading.Lock()
+# Reentrant so that a callback run while the lock is held can safely take it again.
+ui_update_lock = threading.RLock()
 
 # --- Tkinter UI Elements ---
-roots = [None, None]  # root windows for player 1 and 2
+frames = [None, None]  # side-by-side frames for player 1 and 2
 message_labels = [None, None]  # message labels for player 1 and 2
 
+# --- UI Messages ---
+# Registration prompt for each player.
+PLAYER_PROMPTS = {pid: f"Player {pid}: Press any key on your keyboard to register it." for pid in (1, 2)}
+# Built once, when registration completes, since the assigned keyboards no longer change.
+completion_message = None
+
 # --- Helper Functions ---
 
+def build_completion_message():
+    """Lists the keyboard registered by each player."""
+    msg_parts = ["All keyboards registered!\n"]
+    for pid, dev in player_keyboards.items():
+        msg_parts.append(f"Player {pid}: {dev.name} ({dev.path})\n")
+    msg_parts.append("\nComplete. You can close this window.")
+    return "".join(msg_parts)
+
 def update_ui(player_id):
     """
-    Updates both Tkinter windows to prompt for the current player.
+    Updates both player frames to prompt for the current player.
     """
-    global roots, message_labels, player_keyboards
+    global frames, message_labels, player_keyboards, completion_message
+
+    if player_id in PLAYER_PROMPTS and player_id not in player_keyboards:
+        message = PLAYER_PROMPTS[player_id]
+    else:
+        # Registration complete
+        if completion_message is None:
+            completion_message = build_completion_message()
+        message = completion_message
 
     for i in range(2):
-        root = roots[i]
+        frame = frames[i]
         message_label = message_labels[i]
-        if root is None or message_label is None:
+        if frame is None or message_label is None:
             continue
 
-        if player_id == 1 and 1 not in player_keyboards:
-            message = "Player 1: Press any key on your keyboard to register it."
-        elif player_id == 2 and 2 not in player_keyboards:
-            message = "Player 2: Press any key on your keyboard to register it."
-        else:
-            # Registration complete
-            msg_parts = ["All keyboards registered!\n"]
-            for pid, dev in player_keyboards.items():
-                msg_parts.append(f"Player {pid}: {dev.name} ({dev.path})\n")
-            message = "".join(msg_parts)
-            message += "\nComplete. You can close this window."
-
-        message_label.config(text=message)
+        # Skip redundant config calls, which still force a geometry recompute.
+        if message_label.cget("text") != message:
+            message_label.config(text=message)
 
 def start():
-    """Initializes and runs the dual-window Tkinter application using Toplevel windows."""
-    global roots, message_labels
+    """Initializes and runs the dual-screen Tkinter application in a single window with a frame per player."""
+    global frames, message_labels
 
     root = tk.Tk()
-    root.withdraw()  # Hide the root window
+    root.title("Keyboard Registration")
+    root.geometry("2560x710+0+0")  # Spans both screens; adjust as needed
+    root.resizable(False, False)
 
-    # Create two Toplevel windows, one for each player
+    # Create two frames side by side, one for each player
     for i in range(2):
-        win = tk.Toplevel(root)
-        win.title(f"Keyboard Registration - Player {i+1}")
-        win.geometry(f"1270x710+{i*1280}+0")  # Position windows side by side; adjust as needed
-        win.resizable(False, False)
-        label = tk.Label(win, text="", font=("Inter", 16), wraplength=550, justify=tk.LEFT)
+        frame = tk.Frame(root, width=1270, height=710)
+        frame.pack_propagate(False)  # Keep the fixed size instead of shrinking to fit the label
+        frame.pack(side=tk.LEFT, padx=5)
+        label = tk.Label(frame, text="", font=("Inter", 16), wraplength=550, justify=tk.LEFT)
         label.pack(expand=True, padx=20, pady=20)
-        roots[i] = win
+        frames[i] = frame
         message_labels[i] = label
 
-    # Initial UI update for both windows
+    # Initial UI update for both frames
     update_ui(1)
 
+    # Called on the Tkinter thread by the monitoring thread once registration is complete
+    def shutdown():
+        stop_event.set()
+        root.destroy()  # Also ends the main loop
+
     # Start keyboard monitoring thread
     monitor_thread = threading.Thread(
         target=monitor_keyboards_thread,
-        args=(current_player_registering, player_keyboards, is_running, root, ui_update_lock, update_ui),
+        args=(current_player_registering, player_keyboards, stop_event, root, ui_update_lock, update_ui, shutdown),
         daemon=True
     )
     monitor_thread.start()
 
-    # Periodically check if game is complete and close both windows
-    def check_game_status_and_exit():
-        if not is_running:
-            for win in roots:
-                if win is not None:
-                    win.destroy()
-            root.quit()
-        else:
-            root.after(100, check_game_status_and_exit)
-
-    root.after(100, check_game_status_and_exit)
-
     root.mainloop()
     print("Tkinter main loop finished.")
 
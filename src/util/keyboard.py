@@ -1,185 +1,357 @@
 import evdev
-from evdev import InputDevice, categorize, ecodes
+import pyudev
+from evdev import InputDevice, ecodes
 import time
-import select
+import selectors
 import os
-import fcntl
+
+
+# Typical QWERTY keys probed by `is_keyboard`.
+_PROBE_KEYS = frozenset({ecodes.KEY_A, ecodes.KEY_Z, ecodes.KEY_SPACE, ecodes.KEY_ENTER, ecodes.KEY_1})
+
+# Results of `is_keyboard`, keyed by (path, bustype, vendor, product) so a node
+# reused by a different device is classified again.
+_is_kbd_cache = {}
+
 
 def is_keyboard(device):
     """
     Checks if an evdev device is likely a keyboard.
     This is a heuristic based on device capabilities.
     """
+    cache_key = (device.path, device.info.bustype, device.info.vendor, device.info.product)
+    cached = _is_kbd_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     # A keyboard must support EV_KEY events (key presses/releases).
-    if ecodes.EV_KEY not in device.capabilities():
-        return False
+    # Capabilities are queried once, as each call re-reads them from the device.
+    key_caps = device.capabilities().get(ecodes.EV_KEY)
 
     # Additionally, check for common keyboard keys to be more specific.
     # This helps filter out devices like mice that might also send some EV_KEY events.
     # We check for a selection of typical QWERTY keys.
-    if any(k in device.capabilities()[ecodes.EV_KEY] for k in [ecodes.KEY_A, ecodes.KEY_Z, ecodes.KEY_SPACE, ecodes.KEY_ENTER, ecodes.KEY_1]):
-        return True
-    return False
+    result = bool(key_caps) and not _PROBE_KEYS.isdisjoint(key_caps)
+    _is_kbd_cache[cache_key] = result
+    return result
 
 
-def discover_available_keyboards(player_keyboards):
+# Discovered keyboards are kept open between scans, since the set of attached
+# devices rarely changes while the monitoring thread is polling for key presses.
+_CACHE_TTL = 2.0 # Seconds before the device directories are re-scanned
+_cache = {'ts': 0.0, 'devs': {}} # {'ts': monotonic scan time, 'devs': {path: InputDevice}}
+# Event paths classified as something other than a keyboard, so re-scans skip
+# opening them. A path is forgotten when udev reports a change to its device node.
+# Known keyboards need no such set: they are the keys of `_cache['devs']`.
+_known_nonkeyboard_paths = set()
+
+
+def _open_keyboard(event_path):
     """
-    Scans for all potential keyboard devices using evdev and returns
-    a dictionary of {file_descriptor: InputDevice} for devices that are:
-    1. Identified as keyboards by `is_keyboard`.
-    2. Not yet assigned to a player.
-    It also ensures devices are opened in non-blocking mode.
+    Opens the device at `event_path` and returns it if it is a keyboard,
+    otherwise returns None. `InputDevice` opens the node with O_NONBLOCK, so
+    reading a device with no events never blocks the thread.
     """
-    available_devices = {}
-    
+    try:
+        dev = InputDevice(event_path)
+    except Exception:
+        # Ignore devices that cannot be opened (e.g., permissions) or are invalid
+        return None
+    try:
+        if not is_keyboard(dev):
+            _known_nonkeyboard_paths.add(event_path)
+            dev.close() # Close non-keyboard devices to release file descriptors
+            return None
+    except Exception:
+        dev.close()
+        return None
+    return dev
+
+
+def _scan_keyboards(assigned_paths):
+    """
+    Re-scans the input devices and refreshes the keyboard cache. Keyboards
+    that are already cached are reused rather than reopened; cached keyboards
+    that have disappeared are closed unless they are assigned to a player.
+    """
+    cached_devices = _cache['devs']
+    keyboards = {} # {path: InputDevice}
+    # Every event path probed so far, keyboard or not, so no device is opened twice.
+    seen_paths = set()
+
     # Use /dev/input/by-id for more stable and unique device identification.
     # This directory contains symbolic links that usually point to /dev/input/eventX
     # but use persistent IDs, making it easier to distinguish between identical devices.
-    by_id_devices = {}
+    # The links are a single hop (e.g. "../event3"), so one readlink resolves them.
     by_id_path = '/dev/input/by-id'
-    if os.path.exists(by_id_path):
-        for entry in os.listdir(by_id_path):
-            full_path = os.path.join(by_id_path, entry)
-            event_path = os.path.realpath(full_path) # Resolve symlink to actual /dev/input/eventX path
-            if event_path.startswith('/dev/input/event'):
+    try:
+        by_id_entries = os.scandir(by_id_path)
+    except FileNotFoundError:
+        by_id_entries = None
+    if by_id_entries is not None:
+        with by_id_entries:
+            for entry in by_id_entries:
+                if not entry.is_symlink():
+                    continue
                 try:
-                    dev = InputDevice(event_path)
-                    if is_keyboard(dev):
-                        by_id_devices[dev.path] = dev # Store by path to avoid duplicates
-                    else:
-                        dev.close() # Close non-keyboard devices to release file descriptors
-                except Exception:
-                    # Ignore devices that cannot be opened (e.g., permissions) or are invalid
-                    pass
+                    target = os.readlink(entry.path)
+                except OSError:
+                    continue # The link was removed while scanning
+                event_path = os.path.normpath(os.path.join(by_id_path, target)) # Actual /dev/input/eventX path
+                if not event_path.startswith('/dev/input/event') or event_path in seen_paths:
+                    continue # Several by-id links can point to the same device
+                if event_path in _known_nonkeyboard_paths:
+                    continue
+                seen_paths.add(event_path)
+                dev = cached_devices.get(event_path) or _open_keyboard(event_path)
+                if dev is not None:
+                    keyboards[dev.path] = dev
 
     # Fallback: Also scan /dev/input/event* directly to catch any devices missed by /dev/input/by-id,
     # or if /dev/input/by-id is not populated on the system.
     for path in evdev.list_devices():
-        if path not in by_id_devices: # Avoid re-processing devices already found via by-id
+        if path in seen_paths or path in _known_nonkeyboard_paths:
+            continue # Avoid re-processing devices already probed via by-id or known not to be keyboards
+        seen_paths.add(path)
+        dev = cached_devices.get(path) or _open_keyboard(path)
+        if dev is not None:
+            keyboards[dev.path] = dev
+
+    # Close cached keyboards that are gone, keeping the ones players still hold.
+    for path, dev in cached_devices.items():
+        if path not in keyboards and path not in assigned_paths:
             try:
-                dev = InputDevice(path)
-                if is_keyboard(dev):
-                    by_id_devices[dev.path] = dev
-                else:
-                    dev.close()
+                dev.close()
             except Exception:
                 pass
 
+    _cache['devs'] = keyboards
+    _cache['ts'] = time.monotonic()
+
+
+def _forget_device(dev):
+    """
+    Closes a device that failed and drops it from the keyboard cache, forcing
+    the next call to `discover_available_keyboards` to re-scan.
+    """
+    try:
+        dev.close()
+    except Exception:
+        pass
+    if _cache['devs'].get(dev.path) is dev:
+        del _cache['devs'][dev.path]
+    _cache['ts'] = 0.0
+
+
+def discover_available_keyboards(player_keyboards):
+    """
+    Returns a dictionary of {file_descriptor: InputDevice} for devices that are:
+    1. Identified as keyboards by `is_keyboard`.
+    2. Not yet assigned to a player.
+    The devices are served from a cache that is only re-scanned every
+    `_CACHE_TTL` seconds, or sooner if a device error invalidated it.
+    Devices are opened in non-blocking mode and stay open between calls.
+    """
     # Get paths of keyboards already assigned to players to filter them out.
-    assigned_paths = [dev.path for dev in player_keyboards.values()]
+    assigned_paths = {dev.path for dev in player_keyboards.values()}
+
+    if time.monotonic() - _cache['ts'] >= _CACHE_TTL:
+        _scan_keyboards(assigned_paths)
 
-    # Process discovered devices: set non-blocking, add to available_devices if not assigned.
-    for path, dev in by_id_devices.items():
+    available_devices = {}
+    for path, dev in _cache['devs'].items():
         if path not in assigned_paths:
-            # Set the device's file descriptor to non-blocking mode.
-            # This is crucial for `select.select` to work without blocking the thread
-            # if no events are available from a specific device.
-            fd = dev.fd
-            flag = fcntl.fcntl(fd, fcntl.F_GETFL)
-            fcntl.fcntl(fd, fcntl.F_SETFL, flag | os.O_NONBLOCK)
-            available_devices[fd] = dev
+            available_devices[dev.fd] = dev
             # Uncomment for detailed debugging:
-            # print(f"Discovered unassigned keyboard: {dev.name} ({dev.path}) [FD: {fd}]")
-        else:
-            dev.close() # Close devices that are already assigned to release resources
+            # print(f"Discovered unassigned keyboard: {dev.name} ({dev.path}) [FD: {dev.fd}]")
 
     return available_devices
 
 
-def monitor_keyboards_thread(current_player_registering, player_keyboards, is_running, root, ui_update_lock, update_ui):
+# A single idle-time UI refresh is pending at a time; requests made while it is
+# pending only update the player id it will render.
+_ui_pending = False
+_ui_player_id = None
+
+
+def _schedule_ui_update(root, update_ui, player_id):
+    """
+    Schedules `update_ui(player_id)` on the Tkinter thread once it is idle,
+    coalescing a burst of requests into a single redraw for the latest player id.
+    """
+    global _ui_pending, _ui_player_id
+    _ui_player_id = player_id
+    if _ui_pending:
+        return
+    _ui_pending = True
+
+    def run_update():
+        global _ui_pending
+        _ui_pending = False # Cleared before reading the id, so later requests schedule a new refresh
+        update_ui(_ui_player_id)
+
+    root.after_idle(run_update)
+
+
+def _flush_pending_events(devices):
+    """
+    Reads and discards all events queued on the given devices, so key presses
+    made before a registration do not immediately wake the next `select` call.
+    """
+    for dev in devices:
+        try:
+            list(dev.read())
+        except OSError:
+            pass # Nothing queued (BlockingIOError) or the device is gone; select will report the latter.
+
+
+def monitor_keyboards_thread(current_player_registering, player_keyboards, stop_event, root, ui_update_lock, update_ui, shutdown):
     """
     This function runs in a separate thread. It continuously monitors
     key presses from all available keyboards and assigns them to players
-    as keys are pressed.
+    as keys are pressed. Devices are only re-discovered at startup, after a
+    device fails, and when udev reports an input device being plugged in or
+    removed. Assigned keyboards are grabbed and no longer monitored.
+    Once both players are registered,
+    `shutdown` is scheduled on the Tkinter thread to close the windows.
+
+    `current_player_registering` is a one-element list holding the id of the
+    player being registered and `stop_event` is a `threading.Event`, so both
+    threads observe each other's updates to them.
     """
     print("Starting keyboard monitoring thread...")
 
     # Keeps track of devices currently being monitored by THIS thread.
+    # Every device in `open_devices` is registered with `selector`, with the device as its data.
     open_devices = {} # {fd: InputDevice}
+    # Paths of the keyboards in `player_keyboards`, guarded by `ui_update_lock` like the dict itself.
+    assigned_paths = {dev.path for dev in player_keyboards.values()}
+    selector = selectors.DefaultSelector() # epoll on Linux, so readiness is tracked by the kernel
+
+    # Listen for input hotplug events so devices are only re-scanned when they change.
+    # The udev monitor is always registered, so with no unassigned keyboards
+    # the thread simply waits for one to be plugged in.
+    udev_monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+    udev_monitor.filter_by('input')
+    udev_monitor.start()
+    udev_fd = udev_monitor.fileno()
+    selector.register(udev_fd, selectors.EVENT_READ)
+    needs_rescan = True
 
-    while is_running:
+    while not stop_event.is_set():
         with ui_update_lock: # Safely check if Game should continue running
-            if current_player_registering > 2:
+            if current_player_registering[0] > 2:
                 break # Both players registered, stop monitoring
 
-        # Discover currently available (unassigned) keyboards.
-        # This also ensures previously assigned or non-keyboard devices are closed.
-        newly_available_devices = discover_available_keyboards(player_keyboards)
+        if needs_rescan:
+            needs_rescan = False
+            # Discover currently available (unassigned) keyboards.
+            # The devices are owned by the discovery cache, which closes them once they disappear.
+            newly_available_devices = discover_available_keyboards(player_keyboards)
 
-        # Close any devices that were previously open in this thread but are
-        # no longer available, assigned, or relevant.
-        fds_to_close = [fd for fd in open_devices if fd not in newly_available_devices]
-        for fd in fds_to_close:
-            try:
-                open_devices[fd].close()
+            # Stop monitoring any devices that are no longer available, assigned, or relevant.
+            # Devices are compared by identity since a closed device's fd may have been reused.
+            fds_to_drop = [fd for fd, dev in open_devices.items() if newly_available_devices.get(fd) is not dev]
+            for fd in fds_to_drop:
+                selector.unregister(fd)
                 del open_devices[fd]
-                # print(f"Closed old device FD: {fd}")
-            except Exception as e:
-                print(f"Error closing old device {fd}: {e}")
+                # print(f"Stopped monitoring device FD: {fd}")
 
-        # Add newly available devices to our current monitoring set.
-        for fd, dev in newly_available_devices.items():
-            if fd not in open_devices:
-                open_devices[fd] = dev
-                # print(f"Now monitoring: {dev.name} ({dev.path}) [FD: {fd}]")
-
-        if not open_devices:
-            # No unassigned keyboards to listen to, wait a bit before re-scanning.
-            time.sleep(0.5)
-            continue
+            # Add newly available devices to our current monitoring set.
+            for fd, dev in newly_available_devices.items():
+                if fd not in open_devices:
+                    try:
+                        selector.register(fd, selectors.EVENT_READ, dev)
+                    except (OSError, ValueError) as e:
+                        # The device was closed or unplugged since it was discovered.
+                        print(f"Could not monitor {dev.name} ({dev.path}): {e}")
+                        _forget_device(dev)
+                        needs_rescan = True
+                        continue
+                    open_devices[fd] = dev
+                    # print(f"Now monitoring: {dev.name} ({dev.path}) [FD: {fd}]")
 
-        read_fds = list(open_devices.keys())
-        
         try:
-            # Use select.select to wait for data on any of the file descriptors.
-            # The timeout (0.05s) prevents blocking indefinitely, allowing the
-            # `is_running` flag to be checked and the thread to terminate gracefully.
-            rlist, _, _ = select.select(read_fds, [], [], 0.05)
-        except ValueError as e:
+            # Wait for data on any of the registered file descriptors. This returns as
+            # soon as a key is pressed, so the timeout only bounds how long an idle thread
+            # takes to notice `stop_event` and terminate gracefully.
+            ready = selector.select(timeout=0.5)
+        except (OSError, ValueError) as e:
             # This can happen if a file descriptor becomes invalid.
-            print(f"Select error (ValueError): {e}. Re-scanning devices.")
+            print(f"Select error: {e}. Re-scanning devices.")
             # Force a re-discovery of devices on the next iteration.
-            for dev in open_devices.values():
-                try:
-                    dev.close()
-                except Exception:
-                    pass
+            for fd, dev in open_devices.items():
+                selector.unregister(fd)
+                _forget_device(dev)
             open_devices.clear()
+            needs_rescan = True
             time.sleep(0.1)
             continue
         except Exception as e:
             # Catch any other unexpected errors during select.
-            print(f"An unexpected error occurred in select.select: {e}")
+            print(f"An unexpected error occurred in selector.select: {e}")
             time.sleep(0.1)
             continue
 
-        for fd in rlist: # Iterate through file descriptors that have events ready
-            dev = open_devices.get(fd)
-            if not dev:
+        for key, _ in ready: # Iterate through file descriptors that have events ready
+            fd = key.fd
+            if fd == udev_fd:
+                # A device was plugged in or removed: drain the queued udev events,
+                # forgetting how their nodes were classified, and force a full re-scan
+                # on the next iteration.
+                udev_device = udev_monitor.poll(0)
+                while udev_device is not None:
+                    _known_nonkeyboard_paths.discard(udev_device.device_node)
+                    udev_device = udev_monitor.poll(0)
+                _cache['ts'] = 0.0
+                needs_rescan = True
+                continue
+
+            dev = key.data
+            if open_devices.get(fd) is not dev:
                 continue # Device might have been removed or closed
 
             try:
                 # Read all pending events from the device.
                 for event in dev.read():
                     if event.type == ecodes.EV_KEY: # We are interested in key events
-                        data = categorize(event)
-                        if data.keystate == data.key_down: # Only process key presses (not releases)
+                        if event.value == 1: # KeyEvent.key_down: only process key presses (not releases or repeats)
                             print(f"Key press detected on: {dev.name} ({dev.path})")
                             
-                            with ui_update_lock: # Acquire lock before modifying shared state
+                            # Hold the lock only while modifying shared state; the Tkinter
+                            # thread may be waiting on it to render the previous update.
+                            with ui_update_lock:
                                 # Assign keyboard to the current player if it's not already assigned
-                                if current_player_registering <= 2 and dev.path not in [d.path for d in player_keyboards.values()]:
-                                    player_keyboards[current_player_registering] = dev
-                                    print(f"Assigned Player {current_player_registering} to keyboard: {dev.name} ({dev.path})")
-                                    current_player_registering += 1
-                                    # Schedule UI update on the main Tkinter thread.
-                                    root.after(0, update_ui, current_player_registering)
-                                    
-                                    if current_player_registering > 2:
-                                        print("Both players registered. Monitoring thread will stop.")
-                                        is_running = False # Signal thread to terminate
-                                        break # Exit event loop
-                if not is_running:
+                                player_id = current_player_registering[0]
+                                is_assigned = player_id <= 2 and dev.path not in assigned_paths
+                                if is_assigned:
+                                    player_keyboards[player_id] = dev
+                                    assigned_paths.add(dev.path)
+                                    next_player_id = player_id + 1
+                                    current_player_registering[0] = next_player_id
+                            if not is_assigned:
+                                continue
+
+                            print(f"Assigned Player {player_id} to keyboard: {dev.name} ({dev.path})")
+                            # Stop monitoring the assigned keyboard, and grab it so its key presses
+                            # neither wake this thread nor leak to the desktop while others register.
+                            selector.unregister(fd)
+                            del open_devices[fd]
+                            try:
+                                dev.grab()
+                            except OSError as e:
+                                print(f"Could not grab {dev.name} ({dev.path}): {e}")
+                            # Schedule UI update on the main Tkinter thread.
+                            _schedule_ui_update(root, update_ui, next_player_id)
+
+                            if next_player_id > 2:
+                                print("Both players registered. Monitoring thread will stop.")
+                                stop_event.set() # Signal thread to terminate
+                                root.after(0, shutdown) # Tear down the windows on the Tkinter thread
+                            # Discard key presses queued before this registration.
+                            _flush_pending_events(open_devices.values())
+                            break # Exit event loop
+                if stop_event.is_set():
                     break # Exit fd loop if Game is done
             except BlockingIOError:
                 pass # No more events to read from this device right now, continue to next fd.
@@ -187,27 +359,30 @@ def monitor_keyboards_thread(current_player_registering, player_keyboards, is_ru
                 # Handle cases where a device might be disconnected or have permission issues.
                 print(f"OSError reading from {dev.name} ({dev.path}): {e}. Device might be disconnected.")
                 if fd in open_devices:
-                    try:
-                        open_devices[fd].close()
-                    except Exception:
-                        pass
-                    del open_devices[fd]
+                    selector.unregister(fd)
+                    _forget_device(open_devices.pop(fd)) # Also invalidates the discovery cache
+                needs_rescan = True
                 break # Break from this fd loop to force a re-evaluation of `open_devices`
             except Exception as e:
                 # Catch any other unexpected errors during event processing.
                 print(f"Error processing event from {dev.name} ({dev.path}): {e}")
-        
-        # Small sleep to prevent a tight loop if no events are detected but is_running is still true.
-        if is_running:
-            time.sleep(0.01) 
 
     print("Keyboard monitoring thread finished.")
+    selector.close()
+    # Release the grabs on assigned keyboards before their devices are closed below.
+    for dev in player_keyboards.values():
+        try:
+            dev.ungrab()
+        except Exception:
+            pass
     # Ensure all open device file descriptors are explicitly closed when the thread exits.
-    for dev in open_devices.values():
+    for dev in _cache['devs'].values():
         try:
             dev.close()
         except Exception:
             pass
+    _cache['devs'] = {}
+    _cache['ts'] = 0.0
     for dev in player_keyboards.values():
         try:
             dev.close()